@@ -1,6 +1,10 @@
-import uuid
+import asyncio
+import os
+import re
+import time
 from contextlib import asynccontextmanager
 from typing import Optional
+from urllib.parse import parse_qsl
 
 from fastapi import (
     BackgroundTasks,
@@ -12,14 +16,13 @@ from fastapi import (
     WebSocket,
     WebSocketDisconnect,
 )
-from fastapi.responses import HTMLResponse
 from loguru import logger
-from sqlalchemy import select
+from sqlalchemy import bindparam, lambda_stmt, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from twilio.twiml.voice_response import Connect, VoiceResponse
 
 from caller.twilio_client import CallHandler
-from db.db_session import AsyncSessionLocal, get_db, init_db
+from db.db_session import AsyncSessionLocal, get_db, get_db_ro, init_db
 from db.models import FeedbackSession, SessionStatus
 from helpers import require_env
 from schemas import FeedbackResponse, FeedbackStatusResponse
@@ -31,17 +34,69 @@ async def lifespan(app: FastAPI):
     # Startup
     await init_db()
     logger.info("Database initialized")
+
+    # Host used for the media stream websocket URL; fixed for the lifetime of the process
+    base_url = require_env("BASE_URL")
+    app.state.base_ws_host = base_url.removeprefix("https://").removeprefix("http://")
+    app.state.voice_twiml_template = _build_voice_twiml_template(app.state.base_ws_host)
+
+    app.state.call_handler = CallHandler()
+    await app.state.call_handler.startup()
+
+    app.state.status_queue = asyncio.Queue()
+    status_writer = asyncio.create_task(_status_writer(app.state.status_queue))
     yield
-    # Shutdown (if needed)
+    # Shutdown
     logger.info("Shutting down...")
+    # Flush pending status updates before stopping the writer
+    await app.state.status_queue.join()
+    status_writer.cancel()
+    await app.state.call_handler.aclose()
 
 app = FastAPI(title="Hostel Feedback Agent", lifespan=lifespan)
 
-call_handler = CallHandler()
+# Booking details of initiated calls whose media stream hasn't opened yet, so the
+# websocket handshake can skip the DB. Entries are removed when the stream opens,
+# the call can't be placed, or Twilio reports the call as finished. Callbacks that
+# land on another worker never remove theirs, so entries also expire and the dict
+# is capped; anything missing here falls back to the DB.
+ACTIVE_TASKS: dict[str, tuple[float, dict]] = {}
+ACTIVE_TASK_TTL_SECS = 300
+ACTIVE_TASKS_MAX = 1000
+
+
+def _cache_active_task(task_id: str, booking_details: dict):
+    """Cache booking details for the stream handshake, evicting expired and excess entries."""
+    now = time.monotonic()
+    # Dicts keep insertion order, so the oldest entries come first
+    while ACTIVE_TASKS:
+        oldest_id, (expires_at, _) = next(iter(ACTIVE_TASKS.items()))
+        if expires_at > now and len(ACTIVE_TASKS) < ACTIVE_TASKS_MAX:
+            break
+        del ACTIVE_TASKS[oldest_id]
+    ACTIVE_TASKS[task_id] = (now + ACTIVE_TASK_TTL_SECS, booking_details)
+
+
+def _pop_active_task(task_id: str) -> Optional[dict]:
+    """Remove and return cached booking details, if present and not expired."""
+    entry = ACTIVE_TASKS.pop(task_id, None)
+    if entry is None or entry[0] <= time.monotonic():
+        return None
+    return entry[1]
+
+
+async def _place_feedback_call(call_handler: CallHandler, task_id: str, booking_details: dict):
+    """Place the call, dropping the cached booking details if Twilio rejects it (no callback will follow)."""
+    if not await call_handler.handle_feedback_call(task_id=task_id, booking_details=booking_details):
+        ACTIVE_TASKS.pop(task_id, None)
+
+# Booking ids look like BK-2024-001
+_BOOKING_ID_RE = re.compile(r"BK-[0-9]{4}-[0-9]{3,6}")
 
 @app.post("/get_feedback", response_model=FeedbackResponse)
 async def initiate_feedback_call(
     booking_id: str,
+    request: Request,
     background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db)
 ):
@@ -49,9 +104,13 @@ async def initiate_feedback_call(
     Initiates a feedback call for a given booking.
     Returns immediately with a task_id for tracking.
     """
+    # Reject malformed ids before doing any lookup or DB work
+    if not _BOOKING_ID_RE.fullmatch(booking_id):
+        raise HTTPException(status_code=400, detail="Invalid booking_id")
+
     try:
         # Generate unique task ID
-        task_id = f"task_{uuid.uuid4().hex[:12]}"
+        task_id = f"task_{os.urandom(6).hex()}"
         
         # TODO: Mock: Fetch booking details (in production, query your booking DB)
         booking_details = await _get_booking_details(booking_id)
@@ -64,16 +123,19 @@ async def initiate_feedback_call(
             id=task_id,
             booking_id=booking_id,
             phone_number=booking_details["phone_number"],
-            status=SessionStatus.PENDING
+            status=SessionStatus.PENDING,
+            booking_details=booking_details
         )
         
         db.add(session)
         await db.commit()
-        await db.refresh(session)
+
+        _cache_active_task(task_id, booking_details)
 
         # Initiate call in background
         background_tasks.add_task(
-            call_handler.handle_feedback_call,
+            _place_feedback_call,
+            request.app.state.call_handler,
             task_id=task_id,
             booking_details=booking_details
         )
@@ -93,17 +155,14 @@ async def initiate_feedback_call(
 @app.get("/get_feedback/{task_id}", response_model=FeedbackStatusResponse)
 async def get_feedback_status(
     task_id: str,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db_ro)
 ):
     """
     Check the status of a feedback call by task_id.
     Returns the current status and results if completed.
     """
     try:
-        result = await db.execute(
-            select(FeedbackSession).where(FeedbackSession.id == task_id)
-        )
-        session = result.scalar_one_or_none()
+        session = await db.get(FeedbackSession, task_id)
         
         if not session:
             raise HTTPException(status_code=404, detail="Task not found")
@@ -111,7 +170,7 @@ async def get_feedback_status(
         return FeedbackStatusResponse(
             task_id=session.id,
             booking_id=session.booking_id,
-            status=session.status.value,
+            status=session.status,
             phone_number=session.phone_number,
             duration_seconds=session.duration_seconds,
             summary=session.summary,
@@ -125,27 +184,28 @@ async def get_feedback_status(
         logger.error(f"Error fetching feedback status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# TODO: Replace with your own phone number for testing.
+# In production, replace this mapping (and `_get_booking_details`) with a real database query.
+# Built once at import instead of on every lookup.
+_MOCK_BOOKINGS: dict[str, dict] = {
+    "BK-2024-001": {
+        "booking_id": "BK-2024-001",
+        "user_id": "USER-123",
+        "phone_number": "+11234567890",
+        "guest_name": "Rohil Pal",
+        "check_in": "2024-01-15",
+        "check_out": "2024-01-20",
+        "room_number": "204",
+        "hostel_name": "City Center Hostel"
+    }
+}
+
 async def _get_booking_details(booking_id: str) -> Optional[dict]:
     """
     Mock function to fetch booking details.
     In production, this would query your booking database.
     """
-    # TODO: Replace with your own phone number for testing.
-    # In production, replace this entire function with a real database query.
-    mock_bookings = {
-        "BK-2024-001": {
-            "booking_id": "BK-2024-001",
-            "user_id": "USER-123",
-            "phone_number": "+11234567890",
-            "guest_name": "Rohil Pal",
-            "check_in": "2024-01-15",
-            "check_out": "2024-01-20",
-            "room_number": "204",
-            "hostel_name": "City Center Hostel"
-        }
-    }
-    
-    return mock_bookings.get(booking_id)
+    return _MOCK_BOOKINGS.get(booking_id)
 
 @app.get("/health")
 async def health_check():
@@ -156,52 +216,64 @@ async def health_check():
 #### TWILIO webhooks ############
 #################################
 
+# Call statuses after which Twilio sends no further updates for the call
+TERMINAL_CALL_STATUSES = {"completed", "failed", "busy", "no-answer"}
+
+# How long the status writer waits to collect more updates before committing
+STATUS_BATCH_WINDOW_SECS = 0.05
+
+# Twilio isn't asked to retry once the callback has returned, so failed batches are retried here
+STATUS_WRITE_ATTEMPTS = 3
+STATUS_RETRY_BACKOFF_SECS = 0.5
+
+# Built once; SQLAlchemy caches the compiled SQL against the lambda
+_SESSION_EXISTS_STMT = lambda_stmt(
+    lambda: select(FeedbackSession.id).where(FeedbackSession.id == bindparam("task_id"))
+)
+
+def _build_voice_twiml_template(base_ws_host: str) -> str:
+    """
+    Render the TwiML returned when the call is answered.
+    Only the stream URL varies per call, so it is rendered once with a `{task_id}` placeholder.
+    """
+    response = VoiceResponse()
+
+    response.say(
+        "Please wait while you get connected to our customer service representative",
+        voice="Google.en-US-Chirp3-HD-Aoede"
+    )
+
+    response.pause(length=1)
+
+    connect = Connect()
+    connect.stream(url=f"wss://{base_ws_host}/twilio/stream/{{task_id}}")
+    response.append(connect)
+    return str(response)
+
 @app.post("/twilio/voice/{task_id}")
-async def twilio_voice_webhook(task_id: str, db: AsyncSession = Depends(get_db)):
+async def twilio_voice_webhook(task_id: str, request: Request, db: AsyncSession = Depends(get_db)):
     """
     Twilio webhook called when the call is answered.
     Returns TwiML instructions to connect the call to OpenAI Realtime API.
+    Reads from the primary: the session was committed seconds ago and may not have
+    reached a read replica yet, and a miss hangs up on the caller.
     """
     logger.info(f"Twilio voice webhook called for task {task_id}")
 
     try:
-        # Fetch booking details from session to personalize greeting
-        result = await db.execute(
-            select(FeedbackSession).where(FeedbackSession.id == task_id)
-        )
-        session = result.scalar_one_or_none()
-        if not session:
+        # Only check that the session exists; the websocket handler loads the full row
+        session_id = await db.scalar(_SESSION_EXISTS_STMT, {"task_id": task_id})
+        if session_id is None:
             logger.error(f'Session not found for task {task_id}')
             response = VoiceResponse()
             response.say("We're sorry, there was an error. Please try again later.")
             response.hangup()
             return Response(content=str(response), media_type="application/xml")
-        
-        # Get booking details
-        # booking_details = await _get_booking_details(session.booking_id)
-
-        response = VoiceResponse()
-        base_url = require_env("BASE_URL").replace('https://', '').replace('http://', '')
-        
-        response.say(
-            "Please wait while you get connected to our customer service representative",
-            voice="Google.en-US-Chirp3-HD-Aoede"
-        )
-
-        response.pause(length=1)
 
-        connect = Connect()
-        connect.stream(url=f"wss://{base_url}/twilio/stream/{task_id}")
-        response.append(connect)
+        twiml = request.app.state.voice_twiml_template.format(task_id=task_id)
         logger.info(f"/twilio/voice/{task_id} successfully finished.")
-        return HTMLResponse(content=str(response), media_type="application/xml")
+        return Response(content=twiml, media_type="application/xml")
 
-    except RuntimeError as e:
-        logger.error(f"Configuration error: {e}")
-        response = VoiceResponse()
-        response.say("We're facing a configuration issue. We'll call you again shortly.") 
-        response.hangup()
-           
     except Exception as e:
         logger.error(f"Unexpected error in voice webhook: {str(e)}")
         response = VoiceResponse()
@@ -211,7 +283,7 @@ async def twilio_voice_webhook(task_id: str, db: AsyncSession = Depends(get_db))
     return Response(content=str(response), media_type="application/xml")
         
 @app.post("/twilio/status/{task_id}")
-async def twilio_status_callback(task_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+async def twilio_status_callback(task_id: str, request: Request):
     """
     Twilio status callback
     Whenever status of the call changes, Twilio calls this endpoint to update the status
@@ -225,40 +297,114 @@ async def twilio_status_callback(task_id: str, request: Request, db: AsyncSessio
     6. **`failed`** - Call failed (network issues, invalid number, etc.)
     7. **`no-answer`** - User didn't pick up
     """
-    form_data = await request.form()
-    call_status = form_data.get("CallStatus")
-    call_duration = form_data.get("CallDuration", "0")
+    # Twilio posts a flat x-www-form-urlencoded body; parse it directly rather than
+    # going through Starlette's form machinery for the two fields we read
+    fields = dict(parse_qsl((await request.body()).decode("latin-1")))
+    call_status = fields.get("CallStatus")
+    call_duration = fields.get("CallDuration", "0")
 
     logger.info(f"Call Status update for task {task_id}: {call_status}, duration: {call_duration}s")
 
-    try:
-        result = await db.execute(
-            select(FeedbackSession).where(FeedbackSession.id == task_id)
-        )
+    # Intermediate statuses (queued, ringing, in-progress) don't change the session
+    if call_status not in TERMINAL_CALL_STATUSES:
+        return {"status": "ok"}
 
-        session = result.scalar_one_or_none()
+    # The call is over, so its media stream won't be opened any more
+    ACTIVE_TASKS.pop(task_id, None)
 
-        if not session:
-            logger.warning(f"Session not found for status callback: {task_id}")
-            return {"status": "ok"}
-        
-        if call_status == "completed":
-            # Call completed successfuly - if not already marked as completed by stream
-            if session.status == SessionStatus.IN_PROGRESS:
-                session.status == SessionStatus.COMPLETED
-                session.duration_seconds = int(call_duration)
-                await db.commit()
-        elif call_status in ["failed", "busy", "no-answer"]:
-            # Call failed - marked as failed
-            session.status = SessionStatus.FAILED
-            await db.commit()
+    try:
+        if call_status != "completed":
             logger.error(f"Call failed for task {task_id}: {call_status}")
-        
+
+        # Persisted in batches by `_status_writer`
+        request.app.state.status_queue.put_nowait((task_id, call_status, int(call_duration)))
 
         return {"status": "ok"}
     except Exception as e:
         logger.error(f"Error in status callback for task {task_id}: {str(e)}")
         return {"status": "error", "message": str(e)}
+
+
+async def _status_writer(queue: asyncio.Queue):
+    """
+    Background task that persists terminal call statuses queued by `twilio_status_callback`.
+    Updates arriving within STATUS_BATCH_WINDOW_SECS of each other share one transaction.
+    """
+    while True:
+        batch = [await queue.get()]
+        await asyncio.sleep(STATUS_BATCH_WINDOW_SECS)
+        while not queue.empty():
+            batch.append(queue.get_nowait())
+
+        try:
+            await _persist_status_updates(batch)
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+
+async def _persist_status_updates(batch: list[tuple[str, str, int]]):
+    """
+    Apply a batch, retrying with exponential backoff on failure.
+    If the batch keeps failing, each update is written on its own so one bad row can't sink the rest.
+    """
+    for attempt in range(1, STATUS_WRITE_ATTEMPTS + 1):
+        try:
+            await _apply_status_updates(batch)
+            return
+        except Exception as e:
+            logger.warning(f"Error persisting {len(batch)} call status update(s) (attempt {attempt}/{STATUS_WRITE_ATTEMPTS}): {str(e)}")
+            if attempt < STATUS_WRITE_ATTEMPTS:
+                await asyncio.sleep(STATUS_RETRY_BACKOFF_SECS * 2 ** (attempt - 1))
+
+    for task_id, call_status, call_duration in batch:
+        try:
+            await _apply_status_updates([(task_id, call_status, call_duration)])
+        except Exception as e:
+            logger.error(f"Error persisting call status {call_status} for task {task_id}: {str(e)}")
+
+
+async def _apply_status_updates(batch: list[tuple[str, str, int]]):
+    """
+    Apply a batch of (task_id, call_status, call_duration) updates with a single commit.
+    Rows are updated in place, without loading them (or their transcript/summary) into the session.
+    """
+    failed_task_ids = []
+
+    async with AsyncSessionLocal() as db:
+        for task_id, call_status, call_duration in batch:
+            if call_status == "completed":
+                # Always record the duration; the stream usually marks the session
+                # completed before Twilio's final callback arrives
+                await db.execute(
+                    update(FeedbackSession)
+                    .where(FeedbackSession.id == task_id)
+                    .values(duration_seconds=call_duration)
+                    .execution_options(synchronize_session=False)
+                )
+                # Call completed successfuly - if not already marked as completed by stream
+                await db.execute(
+                    update(FeedbackSession)
+                    .where(
+                        FeedbackSession.id == task_id,
+                        FeedbackSession.status == SessionStatus.IN_PROGRESS
+                    )
+                    .values(status=SessionStatus.COMPLETED)
+                    .execution_options(synchronize_session=False)
+                )
+            else:
+                failed_task_ids.append(task_id)
+
+        if failed_task_ids:
+            # Call failed - marked as failed
+            await db.execute(
+                update(FeedbackSession)
+                .where(FeedbackSession.id.in_(failed_task_ids))
+                .values(status=SessionStatus.FAILED)
+                .execution_options(synchronize_session=False)
+            )
+
+        await db.commit()
         
 
 @app.websocket("/twilio/stream/{task_id}")
@@ -273,12 +419,14 @@ async def handle_media_stream(websocket: WebSocket, task_id: str):
 
 
     try:
-        async with AsyncSessionLocal() as db:
-            result = await db.execute(
-                select(FeedbackSession).where(FeedbackSession.id == task_id)
-            )
+        # Booking details cached when the call was initiated; no DB access needed
+        booking_details = _pop_active_task(task_id)
 
-            session = result.scalar_one_or_none()
+        if booking_details is None:
+            # The DB session is closed before streaming starts, so no pooled
+            # connection is held for the duration of the call
+            async with AsyncSessionLocal() as db:
+                session = await db.get(FeedbackSession, task_id)
 
             if not session:
                 logger.error(f"Session not found: {task_id}.")
@@ -287,18 +435,19 @@ async def handle_media_stream(websocket: WebSocket, task_id: str):
             
             logger.info(f"Successfully fetched session with task id: {session.id} and booking id: {session.booking_id}")
             # Get booking details for conversation context
-            booking_details = await _get_booking_details(session.booking_id)
+            # (sessions created before the snapshot column existed fall back to a lookup)
+            booking_details = session.booking_details or await _get_booking_details(session.booking_id)
 
-            logger.info("Successfully fetched booking details.")
+        logger.info("Successfully fetched booking details.")
 
-            # Call the stream handler from CallHander
-            await call_handler.handle_media_stream(
-                websocket=websocket,
-                task_id=task_id,
-                booking_details=booking_details
-            )
+        # Call the stream handler from CallHander
+        await websocket.app.state.call_handler.handle_media_stream(
+            websocket=websocket,
+            task_id=task_id,
+            booking_details=booking_details
+        )
 
-            logger.info(f"/twilio/stream/{task_id} successfully finished.")
+        logger.info(f"/twilio/stream/{task_id} successfully finished.")
 
     except WebSocketDisconnect:
         logger.info(f"WebSocket disconnected for task {task_id}")
@@ -1,12 +1,18 @@
 import asyncio
-import json
-from typing import Dict, List
 import base64
+import json
+import time
+from collections import deque
+from string import Template
+from functools import lru_cache
+from typing import Dict, List, Optional
 
+import orjson
 import websockets
 from loguru import logger
 from openai import AsyncOpenAI
-from sqlalchemy import select
+from sqlalchemy import update
+from twilio.http.async_http_client import AsyncTwilioHttpClient
 from twilio.rest import Client
 from fastapi import WebSocket, WebSocketDisconnect
 from db.db_session import AsyncSessionLocal
@@ -17,6 +23,11 @@ from datetime import datetime, timezone
 
 VOICE = "alloy"
 
+# Twilio webhook connection overrides: 3s connect timeout, 1.5s read timeout,
+# up to 5 retries on any failure. Appended to the webhook URLs we hand to Twilio.
+# See https://www.twilio.com/docs/usage/webhooks/webhooks-connection-overrides
+TWILIO_CONN_OVERRIDE = "#ct=3000&rt=1500&rc=5&rp=all"
+
 """
 conversation.item.input_audio_transcription.completed: this event is the output of audio transcription for user audio written to the user audio buffer. 
 Transcription begins when the input audio buffer is committed by the client or server (when VAD is enabled).
@@ -26,163 +37,260 @@ response.output_audio_transcript.done: this event is generated when the audio tr
 response.function_call_arguments.delta: this event is generated when a function call needs to be triggered.
 
 """
-LOG_EVENT_TYPES = [
+LOG_EVENT_TYPES = frozenset({
     'error', 'response.content.done', 'rate_limits.updated',
     'response.done', 'input_audio_buffer.committed',
     'input_audio_buffer.speech_stopped', 'input_audio_buffer.speech_started',
     'session.created', 'session.updated', 'conversation.item.input_audio_transcription.completed', 
     'response.output_audio_transcript.done', 'response.function_call_arguments.done', 'response.output_audio.done'
-]
+})
 SHOW_TIMING_MATH = False
 
-class CallHandler:
+# Pre-serialized `input_audio_buffer.append` envelope; only the base64 audio varies per frame
+_OAI_APPEND_PREFIX = '{"type":"input_audio_buffer.append","audio":"'
+_OAI_APPEND_SUFFIX = '"}'
+
+# Closing part of a Twilio media message; the head (with the stream SID) is built once per stream
+_TWILIO_MEDIA_SUFFIX = '"}}'
+
+# Audio sent to Twilio is coalesced into at most one media message per window.
+# The size cap (raw PCMU bytes, ~8 KB once base64-encoded) keeps messages small.
+OUTBOUND_AUDIO_WINDOW_SECS = 0.04
+OUTBOUND_AUDIO_MAX_BYTES = 6000
+
+# Twilio's 20 ms caller frames are coalesced the same way before being appended
+# to the OpenAI input buffer (cap: 200 ms of 8 kHz PCMU)
+INBOUND_AUDIO_WINDOW_SECS = 0.04
+INBOUND_AUDIO_MAX_BYTES = 1600
+
+
+def _session_update(task_id: str):
+    """UPDATE statement for one FeedbackSession row; the row is never loaded into the ORM session"""
+    return (
+        update(FeedbackSession)
+        .where(FeedbackSession.id == task_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+# `session.update` sent to OpenAI at the start of every call, serialized once.
+# The instructions are filled in per call (see `CallHandler.initialize_session`).
+_INSTRUCTIONS_PLACEHOLDER = "__INSTRUCTIONS__"
+_SESSION_UPDATE_TEMPLATE = orjson.dumps({
+    "type": "session.update",
+    "session": {
+        "type": "realtime",
+        "model": "gpt-realtime",
+        "output_modalities": ["audio"],
+        "max_output_tokens": 512,
+        "audio": {
+            "input": {
+                "format": {"type": "audio/pcmu"},
+                "turn_detection": {"type": "server_vad"},
+                "transcription": {
+                    "language": "en",
+                    "model": "whisper-1",
+                }
+            },
+            "output": {
+                "format": {"type": "audio/pcmu"},
+                "voice": "marin"
+            }
+        },
+        "instructions": _INSTRUCTIONS_PLACEHOLDER,
+        "tools": [
+            {
+                "type": "function",
+                "name": "end_conversation",
+                "description": "Call this when you have finished collecting all feedback from user and are ready to end the call",
+                "parameters": {
+                    "type": "object",
+                    "properties": {},
+                    "required": []
+                }
+            }
+        ],
+        "tool_choice": "auto",
+    }
+}).decode()
+
+
+# Speaker labels used when flattening a transcript for the summary prompt
+_ROLE_LABELS = {"user": "USER", "agent": "AGENT"}
+
+# System prompt for the OpenAI agent, parsed once; filled from the booking details per call
+_SYSTEM_PROMPT = Template("""
+You are a friendly feedback collection agent for $hostel_name. 
+You're speaking with $guest_name who recently stayed at the hostel 
+from $check_in to $check_out in room $room_number.
+
+Your goal is to ask the user a single question about the stay at the hotel. That's it!
+
+Remember: This is a real phone call. Be natural, empathetic, and respectful of their time.
+""")
+
+
+@lru_cache(maxsize=1)
+def _load_guidelines() -> str:
+    """Load feedback guidelines from file (read once, on first use)"""
+    try:
+        with open("guidelines/guidelines_samarya.txt", "r") as f:
+            return f.read()
+    except FileNotFoundError:
+        logger.warning("Guidelines file not found, using default guidelines")
+        return """
+        Collect feedback on the following areas:
+        1. Cleanliness of rooms and common areas
+        2. Staff friendliness and helpfulness
+        3. Amenities (WiFi, kitchen, lockers, etc.)
+        4. Location and accessibility
+        5. Noise levels and comfort
+        6. Value for money
+        7. Any specific incidents or concerns
+        8. Overall satisfaction and likelihood to recommend
+        """
+
+
+class _AudioCoalescer:
     """
-    Singleton Class that handles Twilio Voice calls and OpenAI Realtime API integration
+    Coalesces base64 audio chunks into fewer, larger payloads.
+    The first chunk after a quiet window is passed straight through; chunks arriving
+    within the window are buffered and released together once the window has elapsed
+    or `max_bytes` of audio is pending.
     """
-    _instance = None
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
+    def __init__(self, window_secs: float, max_bytes: int):
+        self.window_secs = window_secs
+        self.max_bytes = max_bytes
+        self._buffer = bytearray()
+        self._last_release = 0.0
+
+    def add(self, payload: str) -> Optional[str]:
+        """Add a base64 chunk. Returns the base64 payload to send now, if any."""
+        now = time.monotonic()
+        window_elapsed = now - self._last_release >= self.window_secs
+
+        if not self._buffer and window_elapsed:
+            self._last_release = now
+            return payload
+
+        # base64 chunks can't be concatenated as text (padding), so buffer the raw audio
+        self._buffer += base64.b64decode(payload)
+        if window_elapsed or len(self._buffer) >= self.max_bytes:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[str]:
+        """Release the buffered audio as a single base64 payload, if there is any"""
+        if not self._buffer:
+            return None
+
+        payload = base64.b64encode(self._buffer).decode("ascii")
+        self._buffer.clear()
+        self._last_release = time.monotonic()
+        return payload
+
+    def clear(self):
+        """Drop buffered audio, e.g. when the agent is interrupted"""
+        self._buffer.clear()
+
+
+class CallHandler:
+    """
+    Handles Twilio Voice calls and OpenAI Realtime API integration.
+    Created once in the app lifespan: call `startup()` before use and `aclose()` on shutdown.
+    """
 
     def __init__(self):
-        if hasattr(self, "_initialized"):
-            return
-        
-        self.twilio_client = Client(
-            require_env("TWILIO_ACCOUNT_SID"),
-            require_env("TWILIO_AUTH_TOKEN")
-        )
-        self.openai_client = AsyncOpenAI(api_key=require_env("OPENAI_API_KEY"))
         self.twilio_phone = require_env("TWILIO_PHONE_NUMBER")
 
-        # Load guidelines
-        self.guidelines = self._load_guidelines()
-        
+        # HTTP clients are created in `startup()`, inside the running event loop
+        self.twilio_client = None
+        self.openai_client = None
+
         # Max conversation duration (5 minutes)
         self.max_duration_in_secs = 300
 
-        self._initialized = True
+        # Post-call work (summaries) still running after the media stream has closed
+        self._background_tasks = set()
 
-    def _load_guidelines(self) -> str:
-        """Load feedback guidelines from file"""
-        try:
-            with open("guidelines/guidelines_samarya.txt", "r") as f:
-                return f.read()
-        except FileNotFoundError:
-            logger.warning("Guidelines file not found, using default guidelines")
-            return """
-            Collect feedback on the following areas:
-            1. Cleanliness of rooms and common areas
-            2. Staff friendliness and helpfulness
-            3. Amenities (WiFi, kitchen, lockers, etc.)
-            4. Location and accessibility
-            5. Noise levels and comfort
-            6. Value for money
-            7. Any specific incidents or concerns
-            8. Overall satisfaction and likelihood to recommend
-            """
-        
-    
-    async def handle_feedback_call(self, task_id: str, booking_details: Dict):
+    async def startup(self):
+        """Create the long-lived API clients; their pooled connections are reused across calls"""
+        self.twilio_client = Client(
+            require_env("TWILIO_ACCOUNT_SID"),
+            require_env("TWILIO_AUTH_TOKEN"),
+            http_client=AsyncTwilioHttpClient()
+        )
+        self.openai_client = AsyncOpenAI(api_key=require_env("OPENAI_API_KEY"))
+
+    async def aclose(self):
+        """Close the API clients created in `startup()`, after pending summaries are saved"""
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        await self.twilio_client.http_client.close()
+        await self.openai_client.close()
+
+    async def handle_feedback_call(self, task_id: str, booking_details: Dict) -> bool:
         """
         Initiates a Twilio Call. The actual conversation is handled by the WebSocket Stream endpoint
 
         This method only:
-        1. Updates DB status to IN_PROGRESS
-        2. Initiates the Twilio Call
-        3. Stores the call SID
+        1. Initiates the Twilio Call
+        2. Updates DB status to IN_PROGRESS and stores the call SID
+
+        Returns whether the call was placed.
         """
 
+        try:
+            base_url = require_env("BASE_URL")
+
+            logger.info(f"Starting feedback call for task {task_id}")
+            
+            # Initiate Twilio call
+            # When user answers, Twilio will hit /twilio/voice/{task_id}
+            # That webhook returns TwiML with Stream pointing to /twilio/stream/{task_id}
+            call = await self.twilio_client.calls.create_async(
+                to=booking_details["phone_number"],
+                from_=self.twilio_phone,
+                url=f"{base_url}/twilio/voice/{task_id}{TWILIO_CONN_OVERRIDE}",
+                status_callback=f"{base_url}/twilio/status/{task_id}{TWILIO_CONN_OVERRIDE}",
+                timeout=30      # Ring for 30 seconds before giving up
+            )
+            
+            logger.info(f"Twilio call initiated with SID: {call.sid}")
+
+            # Status and call SID are written together, in one statement
+            session_values = {"status": SessionStatus.IN_PROGRESS, "call_sid": call.sid}
+
+            # Note: We don't wait for the call to complete here
+            # The WebSocket handler will manage the actual conversation
+            # And update the DB when done
+
+        except Exception as e:
+            logger.error(f"Error initiating Twilio call for task {task_id}: {str(e)}")
+            
+            # Update status to failed
+            session_values = {"status": SessionStatus.FAILED}
+
+        # The DB session is only opened for the write, not held across the Twilio API request
         async with AsyncSessionLocal() as db:
             try:
-                base_url = require_env("BASE_URL")
-
-                # Update status to in_progress
-                result = await db.execute(
-                    select(FeedbackSession).where(FeedbackSession.id == task_id)
-                )
-                session = result.scalar_one()
-                session.status = SessionStatus.IN_PROGRESS
+                await db.execute(_session_update(task_id).values(**session_values))
                 await db.commit()
-                
-                logger.info(f"Starting feedback call for task {task_id}")
-                
-                # Initiate Twilio call
-                # When user answers, Twilio will hit /twilio/voice/{task_id}
-                # That webhook returns TwiML with Stream pointing to /twilio/stream/{task_id}
-                call = self.twilio_client.calls.create(
-                    to=booking_details["phone_number"],
-                    from_=self.twilio_phone,
-                    url=f"{base_url}/twilio/voice/{task_id}",
-                    status_callback=f"{base_url}/twilio/status/{task_id}",
-                    timeout=30      # Ring for 30 seconds before giving up
-                )
-                
-                session.call_sid = call.sid
-                await db.commit()
-                
-                logger.info(f"Twilio call initiated with SID: {call.sid}")
-
-                # Note: We don't wait for the call to complete here
-                # The WebSocket handler will manage the actual conversation
-                # And update the DB when done
-
             except Exception as e:
-                logger.error(f"Error initiating Twilio call for task {task_id}: {str(e)}")
-                
-                # Update status to failed
-                result = await db.execute(
-                    select(FeedbackSession).where(FeedbackSession.id == task_id)
-                )
-                session = result.scalar_one_or_none()
-                if session:
-                    session.status = SessionStatus.FAILED
-                    await db.commit()
+                logger.error(f"Error updating session {task_id}: {str(e)}")
+                await db.rollback()
+
+        return session_values["status"] == SessionStatus.IN_PROGRESS
 
     async def initialize_session(self, openai_ws, system_prompt):
         """Control initial session with OpenAI"""
-        session_update = {
-            "type": "session.update",
-            "session": {
-                "type": "realtime",
-                "model": "gpt-realtime",
-                "output_modalities": ["audio"],
-                "max_output_tokens": 512,
-                "audio": {
-                    "input": {
-                        "format": {"type": "audio/pcmu"},
-                        "turn_detection": {"type": "server_vad"},
-                        "transcription": {
-                            "language": "en",
-                            "model": "whisper-1",
-                        }
-                    },
-                    "output": {
-                        "format": {"type": "audio/pcmu"},
-                        "voice": "marin"
-                    }
-                },
-                "instructions": system_prompt,
-                "tools": [
-                    {
-                        "type": "function",
-                        "name": "end_conversation",
-                        "description": "Call this when you have finished collecting all feedback from user and are ready to end the call",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {},
-                            "required": []
-                        }
-                    }
-                ],
-                "tool_choice": "auto",
-            }
-        }
+        # Only the instructions vary per call; splice the JSON-encoded prompt into the template
+        session_update = _SESSION_UPDATE_TEMPLATE.replace(
+            f'"{_INSTRUCTIONS_PLACEHOLDER}"', orjson.dumps(system_prompt).decode(), 1
+        )
 
-        print('Sending session update:', json.dumps(session_update))
-        await openai_ws.send(json.dumps(session_update))
+        logger.debug("Sending session update: {}", session_update)
+        await openai_ws.send(session_update)
 
     async def handle_media_stream(self, websocket: WebSocket, task_id: str, booking_details: Dict):
         """
@@ -193,7 +301,10 @@ class CallHandler:
             uri=f"wss://api.openai.com/v1/realtime?model={require_env('OPENAI_REALTIME_MODEL_NAME')}",
             extra_headers=[
                 ("Authorization", f"Bearer {require_env('OPENAI_API_KEY')}"),
-            ]
+            ],
+            compression=None,  # Compressing small base64 audio frames costs CPU and saves little
+            max_size=2**20,
+            max_queue=64
         ) as openai_ws:
             
             # Get system prompt
@@ -209,23 +320,39 @@ class CallHandler:
             stream_sid = None
             latest_media_timestamp = 0
             last_assistant_item = None
-            mark_queue = []
+            mark_queue = deque()
             response_start_timestamp_twilio = None
             end_call = False
+            twilio_media_prefix = None  # Serialized media-message head for this stream, set on "start"
+            outbound_audio = _AudioCoalescer(OUTBOUND_AUDIO_WINDOW_SECS, OUTBOUND_AUDIO_MAX_BYTES)
+            inbound_audio = _AudioCoalescer(INBOUND_AUDIO_WINDOW_SECS, INBOUND_AUDIO_MAX_BYTES)
 
             # Bidirectional streaming tasks
+            async def flush_audio_to_openai():
+                """Send whatever caller audio is still buffered"""
+                audio_payload = inbound_audio.flush()
+                if audio_payload and openai_ws.state.name == "OPEN":
+                    await openai_ws.send(_OAI_APPEND_PREFIX + audio_payload + _OAI_APPEND_SUFFIX)
+
             async def twilio_to_openai():
                 """Receive audio data from Twilio and send it to the OpenAI Realtime API."""
-                nonlocal stream_sid, latest_media_timestamp, response_start_timestamp_twilio, last_assistant_item, end_call
+                nonlocal stream_sid, latest_media_timestamp, response_start_timestamp_twilio, last_assistant_item, end_call, twilio_media_prefix
                 logger.debug("[START] twilio_to_openai")
 
                 try:
-                    async for message in websocket.iter_text():
-                        # Check if call should be hung by the server
+                    while True:
+                        # Read raw ASGI messages and hand the frame to orjson as delivered
+                        # (text or bytes), skipping Starlette's iter_text/receive_text wrappers
+                        message = await websocket.receive()
+                        if message["type"] == "websocket.disconnect":
+                            raise WebSocketDisconnect(message.get("code", 1000))
+
+                        # Call is being hung up by the server: keep draining frames (without
+                        # forwarding them) so the goodbye audio plays out; `openai_to_twilio`
+                        # ends the bridge once it has
                         if end_call:
-                            logger.info("Twilio <-> FastAPI websocket needs to be close!")
-                            break
-                        data = json.loads(message)
+                            continue
+                        data = orjson.loads(message.get("text") or message["bytes"])
                         event_type = data.get("event")
 
                         if event_type not in ["start", "media"]:
@@ -234,6 +361,9 @@ class CallHandler:
 
                         if event_type == "start":
                             stream_sid = data["start"]["streamSid"]
+                            twilio_media_prefix = (
+                                '{"event":"media","streamSid":' + orjson.dumps(stream_sid).decode() + ',"media":{"payload":"'
+                            )
                             logger.info(f"Twilio stream (SID = {stream_sid}) started")
                             response_start_timestamp_twilio = None
                             latest_media_timestamp = 0
@@ -241,89 +371,142 @@ class CallHandler:
 
                         elif event_type == "media" and openai_ws.state.name == "OPEN":
                             latest_media_timestamp = int(data["media"]["timestamp"])
-                            audio_payload = data["media"]["payload"]
+                            audio_payload = inbound_audio.add(data["media"]["payload"])
 
-                            # Send to OpenAI
-                            openai_event = {
-                                "type": "input_audio_buffer.append",
-                                "audio": audio_payload
-                            }
-                            await openai_ws.send(json.dumps(openai_event))
+                            # Send to OpenAI; the payload is base64 (JSON-safe), so the event is spliced together
+                            if audio_payload:
+                                await openai_ws.send(_OAI_APPEND_PREFIX + audio_payload + _OAI_APPEND_SUFFIX)
 
                             # logger.info(f"Successfully sent event of type {event_type} to OpenAI")
                             
                         elif event_type == "mark":
                             # Handle mark acknowledgment
                             if mark_queue:
-                                mark_queue.pop(0)
+                                mark_queue.popleft()
+
+                        elif event_type == "stop":
+                            # No more caller audio on this stream
+                            await flush_audio_to_openai()
                         
                 
                 except WebSocketDisconnect:
-                    print("Client disconnected.")
+                    logger.debug("Client disconnected.")
+                    await flush_audio_to_openai()
                     if openai_ws.state.name == 'OPEN':
                         await openai_ws.close()
                 finally:
                     logger.info("Bye from `twilio_to_openai`")
 
 
+            async def send_audio_to_twilio(audio_payload: str):
+                """Send a base64 PCMU payload to Twilio as one media message"""
+                if twilio_media_prefix is None:
+                    logger.warning("Dropping agent audio received before the Twilio stream started")
+                    return
+
+                # Only the payload varies within a stream, and base64 needs no JSON escaping
+                await websocket.send_text(twilio_media_prefix + audio_payload + _TWILIO_MEDIA_SUFFIX)
+
+            # Handlers for the OpenAI events the bridge acts on, looked up by event type
+            async def on_user_transcript(response: Dict):
+                """Get user audio transcription"""
+                user_transcript = response.get("transcript", "")
+                if user_transcript:
+                    transcript.append({
+                        "role": "user",
+                        "content": user_transcript
+                    })
+                    logger.info(f"User said: {user_transcript}")
+
+            async def on_agent_transcript(response: Dict):
+                """Get agent audio transcript"""
+                agent_transcript = response.get("transcript", "")
+                if agent_transcript:
+                    transcript.append({
+                        "role": "agent",
+                        "content": agent_transcript
+                    })
+
+            async def on_function_call(response: Dict):
+                """
+                Trigger end_conversation
+                LLM determined that it has collected feedback from the user
+                And so now should end the conversation!
+                """
+                nonlocal conversation_ended
+                func_name = response.get("name")
+                call_id = response.get("call_id")
+
+                if func_name == "end_conversation":
+                    logger.info("LLM requesting to end conversation...")
+                    conversation_ended = True
+
+
+                    # Send function result back to OpenAI as an ACK
+                    func_output = {
+                        "type": "conversation.item.create",
+                        "item": {
+                            "type": "function_call_output",
+                            "call_id": call_id,
+                            "output": orjson.dumps({"status": "conversation_ended"}).decode()
+                        }
+                    }
+
+                    await openai_ws.send(orjson.dumps(func_output).decode())
+
+                    # Trigger final response generation
+                    # await openai_ws.send(json.dumps({"type": "response.create"}))
+
+            async def on_audio_delta(response: Dict):
+                """Handle audio output"""
+                nonlocal last_assistant_item, response_start_timestamp_twilio
+                if "delta" not in response:
+                    return
+
+                # The delta is base64 PCMU; deltas arriving close together go out as one media message
+                audio_payload = outbound_audio.add(response['delta'])
+                if audio_payload:
+                    await send_audio_to_twilio(audio_payload)
+
+                if response.get("item_id") and response["item_id"] != last_assistant_item:
+                    response_start_timestamp_twilio = latest_media_timestamp
+                    last_assistant_item = response["item_id"]
+                    if SHOW_TIMING_MATH:
+                        logger.debug(f"Setting start timestamp for new response: {response_start_timestamp_twilio}ms")
+                
+                # await _send_mark(websocket, stream_sid)
+
+            async def on_audio_done(response: Dict):
+                """Send whatever audio is still buffered once the response audio is complete"""
+                audio_payload = outbound_audio.flush()
+                if audio_payload:
+                    await send_audio_to_twilio(audio_payload)
+
+            openai_event_handlers = {
+                "conversation.item.input_audio_transcription.completed": on_user_transcript,
+                "response.output_audio_transcript.done": on_agent_transcript,
+                "response.function_call_arguments.done": on_function_call,
+                "response.output_audio.delta": on_audio_delta,
+                "response.output_audio.done": on_audio_done,
+                # Trigger an interruption. Your use case might work better using `input_audio_buffer.speech_stopped`, or combining the two.
+                # "input_audio_buffer.speech_started": handle_speech_started_event,
+            }
+
             async def openai_to_twilio():
                 """Receive events from the OpenAI Realtime API, send audio back to Twilio."""
-                nonlocal stream_sid, last_assistant_item, response_start_timestamp_twilio, transcript, conversation_ended, end_call
+                nonlocal end_call
 
                 logger.warning("[START] openai_to_twilio...")
                 try:
                     async for message in openai_ws:
-                        response = json.loads(message)
+                        response = orjson.loads(message)
                         event_type = response.get("type")
                         if event_type in LOG_EVENT_TYPES:
                             logger.warning(f"Event type: {event_type}", response)
 
-
-                        # Get user audio transcription
-                        if event_type == "conversation.item.input_audio_transcription.completed":
-                            user_transcript = response.get("transcript", "")
-                            if user_transcript:
-                                transcript.append({
-                                    "role": "user",
-                                    "content": user_transcript
-                                })
-                                logger.info(f"User said: {user_transcript}")
-
-                        # Get agent audio transcript
-                        if event_type == "response.output_audio_transcript.done":
-                            agent_transcript = response.get("transcript", "")
-                            if agent_transcript:
-                                transcript.append({
-                                    "role": "agent",
-                                    "content": agent_transcript
-                                })
-
-                        # Trigger end_conversation
-                        # LLM determined that it has collected feedback from the user
-                        # And so now should end the conversation!
-                        if event_type == "response.function_call_arguments.done":
-                            func_name = response.get("name")
-                            call_id = response.get("call_id")
-
-                            if func_name == "end_conversation":
-                                logger.info("LLM requesting to end conversation...")
-                                conversation_ended = True
-
-
-                                # Send function result back to OpenAI as an ACK
-                                func_output = {
-                                    "type": "conversation.item.create",
-                                    "item": {
-                                        "type": "function_call_output",
-                                        "call_id": call_id,
-                                        "output": json.dumps({"status": "conversation_ended"})
-                                    }
-                                }
-
-                                await openai_ws.send(json.dumps(func_output))
-
-                                # Trigger final response generation
-                                # await openai_ws.send(json.dumps({"type": "response.create"}))
+                        handler = openai_event_handlers.get(event_type)
+                        if handler:
+                            await handler(response)
 
                         if conversation_ended and event_type == "response.done":
                             logger.info("Hanging up call!")
@@ -338,34 +521,6 @@ class CallHandler:
 
                             break
 
-                        # Handle audio output
-                        if event_type == "response.output_audio.delta" and "delta" in response:
-                            audio_payload = base64.b64encode(base64.b64decode(response['delta'])).decode('utf-8')
-
-                            audio_delta = {
-                                "event": "media",
-                                "streamSid": stream_sid,
-                                "media": {
-                                    "payload": audio_payload
-                                }
-                            }
-                            await websocket.send_json(audio_delta)
-
-                            if response.get("item_id") and response["item_id"] != last_assistant_item:
-                                response_start_timestamp_twilio = latest_media_timestamp
-                                last_assistant_item = response["item_id"]
-                                if SHOW_TIMING_MATH:
-                                    print(f"Setting start timestamp for new response: {response_start_timestamp_twilio}ms")
-                            
-                            # await _send_mark(websocket, stream_sid)
-
-                        # Trigger an interruption. Your use case might work better using `input_audio_buffer.speech_stopped`, or combining the two.
-                        # if event_type == 'input_audio_buffer.speech_started':
-                        #     logger.info("Agent interrupted by user!!")
-                        #     if last_assistant_item:
-                        #         logger.info(f"Interrupting response with id: {last_assistant_item}")
-                        #         # await handle_speech_started_event()
-
                 except Exception as e:
                     logger.error(f"Error in openai_to_twilio: {str(e)}")
                 finally:
@@ -374,15 +529,15 @@ class CallHandler:
             async def handle_speech_started_event():
                 """Handle interruption when the caller's speech starts."""
                 nonlocal response_start_timestamp_twilio, last_assistant_item
-                print("Handling speech started event.")
+                logger.debug("Handling speech started event.")
                 if mark_queue and response_start_timestamp_twilio is not None:
                     elapsed_time = latest_media_timestamp - response_start_timestamp_twilio
                     if SHOW_TIMING_MATH:
-                        print(f"Calculating elapsed time for truncation: {latest_media_timestamp} - {response_start_timestamp_twilio} = {elapsed_time}ms")
+                        logger.debug(f"Calculating elapsed time for truncation: {latest_media_timestamp} - {response_start_timestamp_twilio} = {elapsed_time}ms")
 
                     if last_assistant_item:
                         if SHOW_TIMING_MATH:
-                            print(f"Truncating item with ID: {last_assistant_item}, Truncated at: {elapsed_time}ms")
+                            logger.debug(f"Truncating item with ID: {last_assistant_item}, Truncated at: {elapsed_time}ms")
 
                         truncate_event = {
                             "type": "conversation.item.truncate",
@@ -390,14 +545,15 @@ class CallHandler:
                             "content_index": 0,
                             "audio_end_ms": elapsed_time
                         }
-                        await openai_ws.send(json.dumps(truncate_event))
+                        await openai_ws.send(orjson.dumps(truncate_event).decode())
 
-                    await websocket.send_json({
+                    await websocket.send_text(orjson.dumps({
                         "event": "clear",
                         "streamSid": stream_sid
-                    })
+                    }).decode())
 
                     mark_queue.clear()
+                    outbound_audio.clear()
                     last_assistant_item = None
                     response_start_timestamp_twilio = None
             
@@ -409,14 +565,26 @@ class CallHandler:
                         "streamSid": stream_sid,
                         "mark": {"name": "responsePart"}
                     }
-                    await websocket.send_text(json.dumps(mark_event))
+                    await websocket.send_text(orjson.dumps(mark_event).decode())
                     mark_queue.append("responsePart")
 
-            # Run both streaming tasks concurrently
-            await asyncio.gather(
-                twilio_to_openai(),
-                openai_to_twilio()
-            )
+            # Run both streaming tasks concurrently. When either side finishes (caller hang
+            # up, end of conversation after the goodbye audio, error) the other is cancelled
+            # rather than left running on a dead connection.
+            bridge_tasks = [
+                asyncio.create_task(twilio_to_openai()),
+                asyncio.create_task(openai_to_twilio())
+            ]
+            try:
+                done, _ = await asyncio.wait(bridge_tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in bridge_tasks:
+                    task.cancel()
+                await asyncio.gather(*bridge_tasks, return_exceptions=True)
+
+            # Surface an error from the side that finished first, as gather() did
+            for task in done:
+                task.result()
 
             try:
                 await websocket.close()
@@ -427,44 +595,53 @@ class CallHandler:
             logger.info(f"Feedback session {task_id} completed successfully")
 
             if transcript:
-                logger.info("Generating summary for transcript...")
-
-                summary = await self._generate_summary(transcript=transcript)
-
-                # Update data with transcript and summary
-                async with AsyncSessionLocal() as db:
-                    try:
-                        result = await db.execute(
-                            select(FeedbackSession).where(FeedbackSession.id == task_id)
-                        )
-                        session = result.scalar_one_or_none()
-                        
-                        if session:
-                            # Store transcript and summary
-                            session.transcript = transcript  # JSON column
-                            session.summary = summary  # JSON column
-                            session.status = SessionStatus.COMPLETED
-                            session.completed_at = datetime.now(timezone.utc)
-                            
-                            await db.commit()
-                            logger.info(f"Summary saved for session {task_id} with sentiment: {summary.get('sentiment')}")
-                        else:
-                            logger.error(f"Session {task_id} not found in database")
-                            
-                    except Exception as e:
-                        logger.error(f"Error saving summary to database: {str(e)}")
-                        await db.rollback()
+                # Store the transcript and mark the call completed right away;
+                # the summary is generated in the background and added when ready
+                session_values = {
+                    "transcript": transcript,  # JSON column
+                    "status": SessionStatus.COMPLETED,
+                    "completed_at": datetime.now(timezone.utc)
+                }
             else:
                 logger.warning(f"No transcript available for session {task_id}")
                 # Update status even without transcript
-                async with AsyncSessionLocal() as db:
-                    result = await db.execute(
-                        select(FeedbackSession).where(FeedbackSession.id == task_id)
-                    )
-                    session = result.scalar_one_or_none()
-                    if session:
-                        session.status = SessionStatus.COMPLETED
-                        await db.commit()
+                session_values = {"status": SessionStatus.COMPLETED}
+
+            # One session (and pool checkout) for the post-call write, whichever branch was taken
+            async with AsyncSessionLocal() as db:
+                try:
+                    result = await db.execute(_session_update(task_id).values(**session_values))
+                    await db.commit()
+
+                    if not result.rowcount:
+                        logger.error(f"Session {task_id} not found in database")
+                        return
+                        
+                except Exception as e:
+                    logger.error(f"Error saving session {task_id} to database: {str(e)}")
+                    await db.rollback()
+
+            if transcript:
+                summary_task = asyncio.create_task(self._finalize_summary(task_id, transcript))
+                # Keep a reference until it finishes so the task isn't garbage collected
+                self._background_tasks.add(summary_task)
+                summary_task.add_done_callback(self._background_tasks.discard)
+
+    async def _finalize_summary(self, task_id: str, transcript: List[Dict]):
+        """Generate the summary for a finished call and store it on the session"""
+        logger.info("Generating summary for transcript...")
+
+        summary = await self._generate_summary(transcript=transcript)
+
+        # Short-lived session, opened only once the summary is ready
+        async with AsyncSessionLocal() as db:
+            try:
+                await db.execute(_session_update(task_id).values(summary=summary))  # JSON column
+                await db.commit()
+                logger.info(f"Summary saved for session {task_id} with sentiment: {summary.get('sentiment')}")
+            except Exception as e:
+                logger.error(f"Error saving summary to database: {str(e)}")
+                await db.rollback()
 
     
 #     def _build_system_prompt(self, booking_details: Dict) -> str:
@@ -482,7 +659,7 @@ class CallHandler:
 # How are you doing today?"
 
 # GUIDELINES TO COVER:
-# {self.guidelines}
+# {_load_guidelines()}
 
 # CONVERSATION RULES:
 # 1. Be warm, friendly, and professional - you're representing the hostel
@@ -500,15 +677,7 @@ class CallHandler:
     
     def _build_system_prompt(self, booking_details: Dict) -> str:
         """Build the system prompt for the OpenAI agent"""
-        return f"""
-You are a friendly feedback collection agent for {booking_details['hostel_name']}. 
-You're speaking with {booking_details['guest_name']} who recently stayed at the hostel 
-from {booking_details['check_in']} to {booking_details['check_out']} in room {booking_details['room_number']}.
-
-Your goal is to ask the user a single question about the stay at the hotel. That's it!
-
-Remember: This is a real phone call. Be natural, empathetic, and respectful of their time.
-"""
+        return _SYSTEM_PROMPT.substitute(booking_details)
     
 
 
@@ -530,7 +699,7 @@ Remember: This is a real phone call. Be natural, empathetic, and respectful of t
             # Convert transcript of type List[Dict] to a string
             # so that we can pass it to the LLM 
             conversation_text = "\n".join([
-                f"{turn['role'].upper()}: {turn['content']}"
+                f"{_ROLE_LABELS.get(turn['role']) or turn['role'].upper()}: {turn['content']}"
                 for turn in transcript
             ])
 
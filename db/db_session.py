@@ -1,27 +1,65 @@
+import os
+
 from dotenv import load_dotenv
 from sqlalchemy.ext.asyncio import (AsyncSession, async_sessionmaker,
                                     create_async_engine)
-from sqlalchemy.pool import NullPool
 
 from db.models import Base
 from helpers import require_env
 
 load_dotenv()
 
-DATABASE_URL = require_env("DATABASE_URL")
 
-# For Render, they provide DATABASE_URL with postgres:// which needs to be converted to postgresql://
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql+asyncpg://", 1)
+def _asyncpg_url(url: str) -> str:
+    # For Render, they provide DATABASE_URL with postgres:// which needs to be converted to postgresql://
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql+asyncpg://", 1)
+    return url
+
+
+DATABASE_URL = _asyncpg_url(require_env("DATABASE_URL"))
+
+# Optional read replica for read-only endpoints; without one they share the primary pool
+DATABASE_URL_RO = os.getenv("DATABASE_URL_RO")
 
 IS_RENDER = require_env("RENDER") == "true"
 
+
+def _pool_options(pool_size: int, max_overflow: int) -> dict:
+    # Render's managed Postgres drops idle connections, so recycle them sooner there.
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "300" if IS_RENDER else "1800")),
+        "pool_pre_ping": True,  # Transparently replace connections dropped by the server
+    }
+
+
+# Defaults are sized for concurrent Twilio webhooks + websocket streams; SQLAlchemy's
+# stock pool (5 + 10 overflow) runs dry under call bursts. Render's managed Postgres
+# plans cap connections low, so the stock size is kept there.
 engine = create_async_engine(
     DATABASE_URL,
     echo=False,  # Set to True for SQL query logging
-    poolclass=NullPool if IS_RENDER else None,  # Use NullPool for serverless/render deployments
+    **_pool_options(
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5" if IS_RENDER else "20")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10" if IS_RENDER else "40")),
+    ),
 )
 
+# Separate pool for the read replica, so a burst of writes can't starve the read-only endpoints
+if DATABASE_URL_RO:
+    engine_ro = create_async_engine(
+        _asyncpg_url(DATABASE_URL_RO),
+        echo=False,
+        **_pool_options(
+            pool_size=int(os.getenv("DB_RO_POOL_SIZE", "5" if IS_RENDER else "10")),
+            max_overflow=int(os.getenv("DB_RO_MAX_OVERFLOW", "10" if IS_RENDER else "20")),
+        ),
+    )
+else:
+    engine_ro = engine
+
 AsyncSessionLocal = async_sessionmaker(
     engine,
     class_=AsyncSession,
@@ -30,6 +68,14 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False,
 )
 
+AsyncSessionLocalRO = async_sessionmaker(
+    engine_ro,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False,
+)
+
 
 async def init_db():
     """Initialize database tables"""
@@ -44,4 +90,13 @@ async def get_db() -> AsyncSession:
         try:
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
+
+
+async def get_db_ro() -> AsyncSession:
+    """Dependency for getting async database sessions for read-only endpoints"""
+    async with AsyncSessionLocalRO() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
@@ -21,7 +21,16 @@ class FeedbackSession(Base):
     phone_number = Column(String, nullable=False)
     call_sid = Column(String, nullable=True)  # Twilio call SID
     
-    status = Column(SQLEnum(SessionStatus), default=SessionStatus.PENDING, nullable=False)
+    # Stored as the plain enum value ("pending", "in_progress", ...) in a VARCHAR column
+    status = Column(
+        SQLEnum(
+            SessionStatus,
+            values_callable=lambda e: [member.value for member in e],
+            native_enum=False,
+        ),
+        default=SessionStatus.PENDING,
+        nullable=False,
+    )
     
     # Store full conversation transcript as JSON array
     # Format: [{"role": "agent", "content": "..."}, {"role": "user", "content": "..."}]
@@ -30,6 +39,10 @@ class FeedbackSession(Base):
     # Store structured summary as JSON
     # Format: {"overview": "...", "painpoints": [], "highlights": [], "recommendations": []}
     summary = Column(JSON, nullable=True)
+
+    # Snapshot of the booking taken when the session is created, so the
+    # Twilio webhooks don't have to look the booking up again
+    booking_details = Column(JSON, nullable=True)
     
     duration_seconds = Column(Integer, nullable=True)
     